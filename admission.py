@@ -0,0 +1,181 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Idle buckets are dropped once this many keys are tracked
+MAX_TRACKED_BUCKETS=10000
+
+
+# Requests per second and burst size for a route, None disables that limit
+@dataclass(frozen=True)
+class RouteLimit:
+    user_rate:Optional[float]=None
+    user_burst:int=1
+    board_rate:Optional[float]=None
+    board_burst:int=1
+
+
+# Route patterns are matched in order, the first match wins
+ROUTE_LIMITS:List[Tuple[str, "re.Pattern", RouteLimit]]=[
+    ("board_import", re.compile(r"^/board/(?P<board_id>[^/]+)/import$"), RouteLimit(user_rate=0.05, user_burst=2, board_rate=0.05, board_burst=2)),
+    ("board_export", re.compile(r"^/board/(?P<board_id>[^/]+)/export$"), RouteLimit(user_rate=0.2, user_burst=3, board_rate=0.5, board_burst=5)),
+    ("board_view", re.compile(r"^/board/(?P<board_id>[^/]+)$"), RouteLimit(user_rate=2, user_burst=10, board_rate=20, board_burst=40)),
+    ("board", re.compile(r"^/board/(?P<board_id>[^/]+)/"), RouteLimit(user_rate=5, user_burst=20, board_rate=50, board_burst=100)),
+    ("dashboard", re.compile(r"^/$"), RouteLimit(user_rate=2, user_burst=10)),
+    ("create_board", re.compile(r"^/create_board$"), RouteLimit(user_rate=1, user_burst=5)),
+]
+
+# Requests that may hold a slot at once in one worker. Handlers call Firestore on the
+# event loop, so they run one at a time; what overlaps is streamed exports and imports,
+# which page through Firestore from the thread pool until their body is sent.
+MAX_IN_FLIGHT=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "8"))
+
+# Seconds a client is asked to wait when the worker is saturated
+OVERLOAD_RETRY_AFTER=1
+
+
+class TokenBucket:
+    __slots__=("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate:float, burst:int):
+        self.rate=rate
+        self.burst=burst
+        self.tokens=float(burst)
+        self.updated=time.monotonic()
+
+    def refill(self, now:float):
+        self.tokens=min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated=now
+
+    # Returns 0 when a token was taken, otherwise the seconds until one is available
+    def take(self, now:float):
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -=1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(self, route_limits=None, max_in_flight:int=MAX_IN_FLIGHT):
+        self.route_limits=route_limits if route_limits is not None else ROUTE_LIMITS
+        self.max_in_flight=max_in_flight
+        self.in_flight=0
+        self.buckets:Dict[Tuple[str, str, str], TokenBucket]={}
+        self.admitted=Counter()
+        self.rejected=Counter()
+        self.lock=threading.Lock()
+
+    # Route name and board id of a path, or None for routes that are not limited
+    def match(self, path:str):
+        for name, pattern, limit in self.route_limits:
+            found=pattern.match(path)
+            if found:
+                return name, limit, found.groupdict().get("board_id")
+        return None
+
+    def _take(self, route:str, scope:str, key:str, rate:float, burst:int):
+        now=time.monotonic()
+        with self.lock:
+            bucket=self.buckets.get((route, scope, key))
+            if bucket is None:
+                if len(self.buckets) >= MAX_TRACKED_BUCKETS:
+                    self._prune(now)
+                bucket=TokenBucket(rate, burst)
+                self.buckets[(route, scope, key)]=bucket
+            return bucket.take(now)
+
+    # Dropping buckets that have refilled completely, they behave like new ones
+    def _prune(self, now:float):
+        for bucket_key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[bucket_key]
+
+    def reject(self, route:str, reason:str):
+        with self.lock:
+            self.rejected[(route, reason)] +=1
+
+    # Checked after the user limit, returns the Retry-After seconds or 0
+    def check_board(self, route:str, limit:RouteLimit, board_id:Optional[str]):
+        if limit.board_rate is None or not board_id:
+            return 0
+        wait=self._take(route, "board", board_id, limit.board_rate, limit.board_burst)
+        if wait:
+            self.reject(route, "board_rate")
+        return wait
+
+    # Keyed on the user email, or the client address for anonymous requests
+    def check_user(self, route:str, limit:RouteLimit, user_key:str):
+        if limit.user_rate is None:
+            return 0
+        wait=self._take(route, "user", user_key, limit.user_rate, limit.user_burst)
+        if wait:
+            self.reject(route, "user_rate")
+        return wait
+
+    def try_acquire(self, route:str):
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected[(route, "overloaded")] +=1
+                return False
+            self.in_flight +=1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -=1
+
+    def admit(self, route:str):
+        with self.lock:
+            self.admitted[route] +=1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight":self.in_flight,
+                "max_in_flight":self.max_in_flight,
+                "tracked_buckets":len(self.buckets),
+                "admitted":dict(self.admitted),
+                "rejected":[
+                    {"route":route, "reason":reason, "count":count}
+                    for (route, reason), count in sorted(self.rejected.items())
+                ]
+            }
+
+
+# Response body that gives the admission slot back once it has been sent,
+# or when the response is dropped before that
+class ReleasingBody:
+    def __init__(self, body_iterator, release):
+        self.body_iterator=body_iterator
+        self.release=release
+        self.released=False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.body_iterator.__anext__()
+        except BaseException:
+            # Also covers StopAsyncIteration at the end of the body and cancellation
+            self.close()
+            raise
+
+    def close(self):
+        if not self.released:
+            self.released=True
+            self.release()
+
+    def __del__(self):
+        self.close()
+
+
+def retry_after_header(wait:float):
+    return {"Retry-After":str(max(1, math.ceil(wait)))}
@@ -0,0 +1,323 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import sys
+import uuid
+from datetime import datetime
+from typing import Optional
+from google.cloud import firestore
+
+# Columns written by the export and read back by the import
+EXPORT_FIELDS=["id", "title", "description", "due_date", "completed", "completed_at", "assignees", "created_by", "created_at"]
+
+# Tasks read per page while exporting
+EXPORT_PAGE_SIZE=500
+
+# Firestore allows 500 writes per batch, one of them is the progress document
+IMPORT_BATCH_SIZE=499
+
+# Separator for assignees inside a CSV cell
+CSV_ASSIGNEE_SEPARATOR=";"
+
+
+class TransferError(Exception):
+    pass
+
+
+# Paging through the tasks of a board, only one page is held in memory
+def iter_board_tasks(db, board_id:str, page_size:int=EXPORT_PAGE_SIZE):
+    tasks_ref=db.collection("boards").document(board_id).collection("tasks")
+    last_task=None
+    while True:
+        query=tasks_ref.order_by("__name__").limit(page_size)
+        if last_task is not None:
+            query=query.start_after(last_task)
+        page=list(query.stream())
+        for task in page:
+            yield task
+        if len(page) < page_size:
+            return
+        last_task=page[-1]
+
+
+# Converting a task snapshot to a plain exportable row
+def task_to_row(task):
+    task_data=task.to_dict() or {}
+    row={"id":task.id}
+    for name in EXPORT_FIELDS[1:]:
+        value=task_data.get(name)
+        if hasattr(value, "isoformat"):
+            value=value.isoformat()
+        row[name]=value
+    row["assignees"]=row["assignees"] or []
+    row["completed"]=bool(row["completed"])
+    return row
+
+
+def export_ndjson(db, board_id:str):
+    for task in iter_board_tasks(db, board_id):
+        yield json.dumps(task_to_row(task)) + "\n"
+
+
+def export_csv(db, board_id:str):
+    buffer=io.StringIO()
+    writer=csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for task in iter_board_tasks(db, board_id):
+        row=task_to_row(task)
+        row["assignees"]=CSV_ASSIGNEE_SEPARATOR.join(row["assignees"])
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_board(db, board_id:str, export_format:str):
+    if export_format=="ndjson":
+        return export_ndjson(db, board_id)
+    if export_format=="csv":
+        return export_csv(db, board_id)
+    raise TransferError(f"Unsupported format: {export_format}")
+
+
+# Reading rows from a binary upload one line at a time
+def iter_upload_rows(binary_file, import_format:str):
+    if import_format=="ndjson":
+        # Lines are decoded one by one so that a bad line is reported as that row
+        for raw_line in binary_file:
+            try:
+                line=raw_line.decode("utf-8").strip()
+            except UnicodeDecodeError:
+                yield raw_line
+                continue
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+    elif import_format=="csv":
+        # Decoded line by line so that rows before a bad byte are still imported
+        text_lines=(raw_line.decode("utf-8") for raw_line in binary_file)
+        row_number=0
+        try:
+            for row in csv.DictReader(text_lines):
+                row_number +=1
+                assignees=row.get("assignees") or ""
+                row["assignees"]=[a for a in assignees.split(CSV_ASSIGNEE_SEPARATOR) if a]
+                row["completed"]=str(row.get("completed", "")).lower() in ("true", "1", "yes")
+                yield row
+        except UnicodeDecodeError:
+            # A CSV record can span lines, so the rest of the upload cannot be split reliably
+            raise TransferError(f"Upload is not valid UTF-8 after row {row_number}")
+    else:
+        raise TransferError(f"Unsupported format: {import_format}")
+
+
+# Import id derived from the board and the upload content, so that retrying the
+# same upload resumes it without the caller having to keep the id
+def upload_import_id(board_id:str, binary_file):
+    digest=hashlib.sha256(board_id.encode("utf-8") + b"\0")
+    for chunk in iter(lambda: binary_file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    binary_file.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def parse_timestamp(value, name:str):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise TransferError(f"{name} must be an ISO 8601 string")
+    return datetime.fromisoformat(value)
+
+
+def optional_string(row, name:str):
+    value=row.get(name)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise TransferError(f"{name} must be a string")
+    return value
+
+
+# Document ids Firestore accepts, see the naming constraints of document ids
+def is_valid_document_id(document_id):
+    return (
+        isinstance(document_id, str)
+        and 0 < len(document_id.encode("utf-8")) <= 1500
+        and "/" not in document_id
+        and document_id not in (".", "..")
+        and not (document_id.startswith("__") and document_id.endswith("__"))
+    )
+
+
+# Validating an imported row and turning it into a task document
+def row_to_task(row, allowed_assignees, default_creator:str):
+    if isinstance(row, bytes):
+        raise TransferError("row is not valid UTF-8")
+    if not isinstance(row, dict):
+        raise TransferError("row is not a JSON object")
+    title=optional_string(row, "title").strip()
+    due_date=optional_string(row, "due_date").strip()
+    if not title or not due_date:
+        raise TransferError("title and due_date are required")
+
+    assignees=row.get("assignees") or []
+    if not isinstance(assignees, list) or not all(isinstance(a, str) for a in assignees):
+        raise TransferError("assignees must be a list of emails")
+    unknown=[a for a in assignees if a not in allowed_assignees]
+    if unknown:
+        raise TransferError(f"Assignees are not members of this board: {', '.join(unknown)}")
+
+    # Tasks can only be attributed to board members, otherwise to the importing user
+    created_by=row.get("created_by")
+    if not isinstance(created_by, str) or created_by not in allowed_assignees:
+        created_by=default_creator
+
+    completed=bool(row.get("completed"))
+    created_at=parse_timestamp(row.get("created_at"), "created_at")
+    completed_at=parse_timestamp(row.get("completed_at"), "completed_at")
+    return {
+        "title":title,
+        "description":optional_string(row, "description"),
+        "due_date":due_date,
+        "created_by":created_by,
+        "created_at":created_at or firestore.SERVER_TIMESTAMP,
+        "completed":completed,
+        "completed_at":completed_at if completed else None,
+        "assignees":assignees
+    }
+
+
+# Importing rows in chunked batches, the progress document is committed with each chunk
+# so that a rerun with the same import_id skips the rows that were already written.
+# Existing tasks are only replaced when overwrite is set, otherwise the row is reported.
+def import_tasks(db, board_id:str, rows, default_creator:str, import_id:Optional[str]=None, batch_size:int=IMPORT_BATCH_SIZE, overwrite:bool=False):
+    if import_id is not None and not is_valid_document_id(import_id):
+        raise TransferError("Invalid import id")
+
+    board_ref=db.collection("boards").document(board_id)
+    board=board_ref.get()
+    if not board.exists:
+        raise TransferError("Board not found")
+    board_data=board.to_dict()
+
+    # Members are resolved once for the whole upload
+    allowed_assignees=set(board_data.get("members", []))
+    allowed_assignees.add(board_data["creator"])
+
+    import_id=import_id or uuid.uuid4().hex
+    progress_ref=board_ref.collection("imports").document(import_id)
+    progress=progress_ref.get()
+    progress_data=progress.to_dict() if progress.exists else {}
+    rows_committed=progress_data.get("rows_committed", 0)
+    imported=progress_data.get("imported", 0)
+    errors=[]
+
+    tasks_ref=board_ref.collection("tasks")
+    pending={}
+    row_number=0
+
+    def flush(last_row:int, status:str):
+        nonlocal imported
+        if pending and not overwrite:
+            existing=db.get_all([ref for _, ref, _ in pending.values()], field_paths=[])
+            for snapshot in existing:
+                if snapshot.exists:
+                    number, _, _=pending.pop(snapshot.id)
+                    errors.append({"row":number, "error":f"Task {snapshot.id} already exists"})
+        batch=db.batch()
+        for _, ref, task_data in pending.values():
+            batch.set(ref, task_data)
+        imported +=len(pending)
+        batch.set(progress_ref, {"rows_committed":last_row, "imported":imported, "status":status})
+        batch.commit()
+        pending.clear()
+
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            if row_number <= rows_committed:
+                continue
+            try:
+                task_data=row_to_task(row, allowed_assignees, default_creator)
+                task_id=row.get("id") or f"{import_id}-{row_number}"
+                if not is_valid_document_id(task_id):
+                    raise TransferError("Invalid task id")
+                if task_id in pending:
+                    raise TransferError(f"Task {task_id} appears more than once")
+            except (TransferError, ValueError) as e:
+                errors.append({"row":row_number, "error":str(e)})
+                continue
+
+            pending[task_id]=(row_number, tasks_ref.document(task_id), task_data)
+            if len(pending) >= batch_size:
+                flush(row_number, "running")
+    except TransferError:
+        # The upload itself is unreadable, rows read so far are kept for a resume
+        flush(max(row_number, rows_committed), "failed")
+        raise
+
+    flush(max(row_number, rows_committed), "done")
+
+    errors.sort(key=lambda e:e["row"])
+    return {"import_id":import_id, "imported":imported, "rows":max(row_number, rows_committed), "errors":errors}
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Export or import the tasks of a board")
+    subparsers=parser.add_subparsers(dest="command", required=True)
+
+    export_parser=subparsers.add_parser("export", help="Stream the tasks of a board")
+    export_parser.add_argument("board_id")
+    export_parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export_parser.add_argument("--output", "-o", help="Output file, stdout by default")
+
+    import_parser=subparsers.add_parser("import", help="Bulk import tasks into a board")
+    import_parser.add_argument("board_id")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--format", choices=["ndjson", "csv"])
+    import_parser.add_argument("--import-id", help="Resume a previous import")
+    import_parser.add_argument("--created-by", default="import", help="Creator for rows without a board member as creator")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace tasks that already exist")
+
+    args=parser.parse_args(argv)
+    db=firestore.Client()
+
+    if args.command=="export":
+        output=open(args.output, "w", newline="") if args.output else sys.stdout
+        try:
+            for chunk in export_board(db, args.board_id, args.format):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+        return 0
+
+    import_format=args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    import_id=args.import_id or uuid.uuid4().hex
+    # Printed up front so that an interrupted import can be resumed with --import-id
+    print(f"Import id: {import_id}", file=sys.stderr, flush=True)
+    with open(args.input, "rb") as binary_file:
+        result=import_tasks(
+            db,
+            args.board_id,
+            iter_upload_rows(binary_file, import_format),
+            args.created_by,
+            import_id=import_id,
+            overwrite=args.overwrite
+        )
+    print(json.dumps({k:v for k, v in result.items() if k !="errors"}))
+    for error in result["errors"]:
+        print(f"Row {error['row']}: {error['error']}", file=sys.stderr)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
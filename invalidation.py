@@ -0,0 +1,153 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+from google.cloud import firestore
+
+# Directory where every worker of the instance binds its socket
+DEFAULT_SOCKET_DIR=os.environ.get("INVALIDATION_SOCKET_DIR", "/tmp/taskboard-invalidation")
+
+# Collection used to broadcast invalidations between hosts
+DEFAULT_COLLECTION="invalidations"
+
+# Broadcast documents are only needed briefly, a Firestore TTL policy on expire_at removes them
+BROADCAST_RETENTION=timedelta(hours=1)
+
+
+# Invalidation bus delivering keys only to the current process
+class InvalidationBus:
+    def __init__(self):
+        self.callbacks:List[Callable[[str], None]]=[]
+        self.origin=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def subscribe(self, callback:Callable[[str], None]):
+        self.callbacks.append(callback)
+
+    def deliver(self, key:str):
+        for callback in self.callbacks:
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"Invalidation callback error: {e}")
+
+    # Invalidating locally first, then telling the other workers
+    def publish(self, key:str):
+        self.deliver(key)
+        self.broadcast(key)
+
+    def broadcast(self, key:str):
+        pass
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Workers of one host, each worker binds a datagram socket in a shared directory
+class UnixSocketInvalidationBus(InvalidationBus):
+    def __init__(self, directory:str=DEFAULT_SOCKET_DIR):
+        super().__init__()
+        self.directory=directory
+        # The directory is per host already, a short name keeps the path under the AF_UNIX limit
+        self.path=os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self.sock=None
+        self.sender=None
+        self.closed=threading.Event()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.sock=socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        # Timeout lets the listener notice close()
+        self.sock.settimeout(1.0)
+        self.sender=socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+        threading.Thread(target=self._listen, name="invalidation-listener", daemon=True).start()
+
+    def _listen(self):
+        while not self.closed.is_set():
+            try:
+                data=self.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.deliver(data.decode("utf-8"))
+
+    def broadcast(self, key:str):
+        if self.sender is None:
+            return
+        data=key.encode("utf-8")
+        for name in os.listdir(self.directory):
+            path=os.path.join(self.directory, name)
+            if path==self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self.sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that exited
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                # Full receive buffer, the cache TTL bounds the staleness
+                print(f"Invalidation broadcast error for {name}: {e}")
+
+    def close(self):
+        self.closed.set()
+        for sock in (self.sock, self.sender):
+            if sock is not None:
+                sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# Workers on several hosts, keys are written to a collection every worker listens to
+class FirestoreInvalidationBus(InvalidationBus):
+    def __init__(self, db, collection:str=DEFAULT_COLLECTION):
+        super().__init__()
+        self.db=db
+        self.collection=collection
+        self.watch=None
+
+    def start(self):
+        started_at=datetime.now(timezone.utc)
+        query=self.db.collection(self.collection).where("created_at", ">=", started_at)
+        self.watch=query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name !="ADDED":
+                continue
+            data=change.document.to_dict() or {}
+            if data.get("origin")==self.origin or not data.get("key"):
+                continue
+            self.deliver(data["key"])
+
+    def broadcast(self, key:str):
+        self.db.collection(self.collection).add({
+            "key":key,
+            "origin":self.origin,
+            "created_at":firestore.SERVER_TIMESTAMP,
+            "expire_at":datetime.now(timezone.utc) + BROADCAST_RETENTION
+        })
+
+    def close(self):
+        if self.watch is not None:
+            self.watch.unsubscribe()
+
+
+# Picking the bus from INVALIDATION_BUS: local, unix or firestore
+def create_bus(kind:str, db=None):
+    if kind=="unix":
+        return UnixSocketInvalidationBus()
+    if kind=="firestore":
+        return FirestoreInvalidationBus(db)
+    return InvalidationBus()
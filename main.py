@@ -1,13 +1,23 @@
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException, File, UploadFile
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import google.oauth2.id_token
 from google.auth.transport import requests
 from google.cloud import firestore
 import starlette.status as status
+from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, List, Optional
+import board_transfer
+import admission
+import invalidation
+import profiling
+import random
+import threading
+import os
+import time
 
 # Initializing FastAPI app
 app=FastAPI()
@@ -19,25 +29,116 @@ try:
     db=firestore.Client()
     print("Firestore initialized successfully")
 except Exception as e:
+    db=None
     print(f"Error initializing Firestore: {e}")
 
+# Emails allowed to use the admin endpoints
+ADMIN_EMAILS=set(e.strip() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip())
+
+# Verified tokens are kept until they expire or for this many seconds
+TOKEN_CACHE_TTL=300
+# Rejected tokens are remembered briefly so that garbage cookies are not verified again
+FAILED_TOKEN_CACHE_TTL=60
+TOKEN_CACHE_MAX_SIZE=10000
+token_cache={}
+
+admission_controller=admission.AdmissionController()
+
+INVALIDATION_BUS=os.environ.get("INVALIDATION_BUS", "local")
+
+# Board documents used for access checks, writes on any worker invalidate them through the bus.
+# With the local bus other workers would never hear about membership changes, so nothing is cached.
+BOARD_CACHE_TTL=30 if INVALIDATION_BUS in ("unix", "firestore") else 0
+board_cache={}
+# Bumped on every invalidation, a read that raced with one is not cached
+board_cache_generation=0
+board_cache_lock=threading.Lock()
+
+invalidation_bus=invalidation.create_bus(INVALIDATION_BUS, db)
+
+def on_invalidate(key:str):
+    global board_cache_generation
+    if key.startswith("board:"):
+        with board_cache_lock:
+            board_cache_generation +=1
+            board_cache.pop(key[len("board:"):], None)
+
+invalidation_bus.subscribe(on_invalidate)
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    invalidation_bus.start()
+
+@app.on_event("shutdown")
+async def close_invalidation_bus():
+    invalidation_bus.close()
+
+# Board data from the cache or Firestore, None when the board does not exist
+def get_board(board_id:str):
+    now=time.monotonic()
+    with board_cache_lock:
+        cached=board_cache.get(board_id)
+        generation=board_cache_generation
+    if cached is None or cached[1] <= now:
+        board=db.collection("boards").document(board_id).get()
+        if not board.exists:
+            with board_cache_lock:
+                board_cache.pop(board_id, None)
+            return None
+        cached=(board.to_dict(), now + BOARD_CACHE_TTL)
+        if BOARD_CACHE_TTL > 0:
+            with board_cache_lock:
+                if board_cache_generation==generation:
+                    board_cache[board_id]=cached
+    board_data=dict(cached[0])
+    board_data["members"]=list(board_data.get("members", []))
+    return board_data
+
+def invalidate_board(board_id:str):
+    invalidation_bus.publish(f"board:{board_id}")
+
 # Verifying Google ID token
 async def verify_token(request: Request):
+    # Already verified for this request by the admission middleware
+    if hasattr(request.state, "token_data"):
+        return request.state.token_data
+
     token =""
     if "token" in request.cookies:
         token=request.cookies.get("token")
     
     if not token:
+        request.state.token_data=None
         return None
+
+    now=time.time()
+    cached=token_cache.get(token)
+    if cached and cached[1] > now:
+        request.state.token_data=cached[0]
+        return cached[0]
     
     try:
         auth_req=requests.Request()
         decoded_token=google.oauth2.id_token.verify_firebase_token(token, auth_req)
-        return decoded_token
+    except ValueError as e:
+        # Invalid or expired token, remembered as rejected
+        print(f"Token verification error: {e}")
+        decoded_token=None
     except Exception as e:
+        # Transport errors are not cached, the token may well be valid
         print(f"Token verification error: {e}")
+        request.state.token_data=None
         return None
 
+    if len(token_cache) >= TOKEN_CACHE_MAX_SIZE:
+        token_cache.clear()
+    if decoded_token:
+        token_cache[token]=(decoded_token, min(decoded_token.get("exp", now), now + TOKEN_CACHE_TTL))
+    else:
+        token_cache[token]=(None, now + FAILED_TOKEN_CACHE_TTL)
+    request.state.token_data=decoded_token
+    return decoded_token
+
 # User email from the token
 async def get_user_email(token_data):
     if not token_data:
@@ -56,6 +157,194 @@ async def get_current_user(request: Request):
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
     return token_data
 
+# Fields read by the board list view, description is only shown on the task page
+TASK_LIST_FIELDS=["title", "due_date", "completed", "completed_at", "assignees"]
+
+# Compact task record for list views
+@dataclass(slots=True)
+class TaskRecord:
+    id:str
+    title:str=""
+    due_date:str=""
+    completed:bool=False
+    completed_at:Any=None
+    assignees:List[str]=field(default_factory=list)
+
+    @property
+    def unassigned(self):
+        return len(self.assignees)==0
+
+    @classmethod
+    def from_snapshot(cls, task):
+        # Fields missing from the document are not in the projection either
+        task_data=task.to_dict() or {}
+        return cls(
+            id=task.id,
+            title=task_data.get("title") or "",
+            due_date=task_data.get("due_date") or "",
+            completed=bool(task_data.get("completed", False)),
+            completed_at=task_data.get("completed_at"),
+            assignees=task_data.get("assignees") or []
+        )
+
+# Tasks subcollection of a board
+def tasks_collection(board_id:str):
+    return db.collection("boards").document(board_id).collection("tasks")
+
+# Counting tasks on the server without fetching them
+def count_tasks(board_id:str):
+    results=tasks_collection(board_id).count().get()
+    return int(results[0][0].value)
+
+# Profiling a request when an admin asks for it with the header or when it is sampled.
+# Registered before the admission middleware so that it runs inside it: shed requests
+# are never profiled and the admin check uses the identity admission already verified.
+@app.middleware("http")
+async def profiling_middleware(request:Request, call_next):
+    profiling.request_started()
+    response=None
+    try:
+        response=await profile_request(request, call_next)
+        # Streamed bodies are still being produced until the body iterator is done
+        response.body_iterator=admission.ReleasingBody(response.body_iterator, profiling.request_finished)
+        return response
+    finally:
+        if response is None:
+            profiling.request_finished()
+
+async def profile_request(request:Request, call_next):
+    profile=False
+    if request.headers.get(profiling.PROFILE_HEADER):
+        token_data=getattr(request.state, "token_data", None)
+        profile=await get_user_email(token_data) in ADMIN_EMAILS
+    elif profiling.PROFILE_SAMPLE_RATE and random.random() < profiling.PROFILE_SAMPLE_RATE:
+        profile=not request.url.path.startswith(("/static", "/admin"))
+
+    # The sampler sees the whole event loop thread, so one profile per worker at a time
+    if not profile or not profiling.profile_slot.acquire(blocking=False):
+        return await call_next(request)
+
+    # Handlers run on the event loop thread, streamed bodies add their pool threads
+    sampler=profiling.StackSampler(threading.get_ident())
+    other_requests_at_start=profiling.requests_in_flight - 1
+    response=None
+    profile_id=None
+
+    # Runs once the body has been sent, so streamed exports are profiled up to the last row
+    def finish_profile():
+        sampler.stop()
+        other_requests_at_stop=profiling.requests_in_flight - 1
+        profiling.profile_slot.release()
+        if profile_id is None:
+            return
+        route=request.scope.get("route")
+        profiling.save_profile(
+            profile_id,
+            sampler,
+            request.method,
+            route.path if route else request.url.path,
+            request.url.path,
+            response.status_code,
+            other_requests_at_start,
+            other_requests_at_stop
+        )
+
+    sampler.start()
+    sampler_token=profiling.current_sampler.set(sampler)
+    try:
+        response=await call_next(request)
+    except BaseException:
+        finish_profile()
+        raise
+    finally:
+        profiling.current_sampler.reset(sampler_token)
+
+    route=request.scope.get("route")
+    profile_id=profiling.new_profile_id(route.path if route else request.url.path)
+    response.headers["X-Profile-Id"]=profile_id
+    response.body_iterator=admission.ReleasingBody(response.body_iterator, finish_profile)
+    return response
+
+# Admission control, requests over their rate or above the worker capacity
+# are rejected before any Firestore work is done
+@app.middleware("http")
+async def admission_middleware(request:Request, call_next):
+    matched=admission_controller.match(request.url.path)
+    if matched is None:
+        return await call_next(request)
+    route, limit, board_id=matched
+
+    if not admission_controller.try_acquire(route):
+        return JSONResponse(
+            {"detail":"Server is busy, try again later"},
+            status_code=503,
+            headers=admission.retry_after_header(admission.OVERLOAD_RETRY_AFTER)
+        )
+    response=None
+    try:
+        # Tokens are cached, so identifying the caller is cheap for a client that keeps retrying
+        token_data=await verify_token(request)
+        user_email=await get_user_email(token_data)
+        user_key=user_email or f"ip:{request.client.host if request.client else 'unknown'}"
+        wait=admission_controller.check_user(route, limit, user_key)
+        if wait:
+            return JSONResponse(
+                {"detail":"Too many requests"},
+                status_code=429,
+                headers=admission.retry_after_header(wait)
+            )
+
+        # Only signed-in requests that passed their own limit use the board budget,
+        # so one client or anonymous traffic cannot exhaust it for the members
+        if user_email:
+            wait=admission_controller.check_board(route, limit, board_id)
+            if wait:
+                return JSONResponse(
+                    {"detail":"Too many requests for this board"},
+                    status_code=429,
+                    headers=admission.retry_after_header(wait)
+                )
+
+        admission_controller.admit(route)
+        response=await call_next(request)
+        # The slot is held until the body is sent, streamed exports page through Firestore meanwhile
+        response.body_iterator=admission.ReleasingBody(response.body_iterator, admission_controller.release)
+        return response
+    finally:
+        if response is None:
+            admission_controller.release()
+
+async def require_admin(request:Request):
+    token_data=await verify_token(request)
+    user_email=await get_user_email(token_data)
+    if user_email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+# Admission counters of this worker
+@app.get("/admin/admission")
+async def admission_stats(request:Request):
+    await require_admin(request)
+    return JSONResponse(admission_controller.stats())
+
+# Recent request profiles, newest first
+@app.get("/admin/profiles")
+async def list_profiles(request:Request, route:Optional[str]=None, limit:int=50):
+    await require_admin(request)
+    return JSONResponse(profiling.list_profiles(route, limit))
+
+# Collapsed stacks of one profile, can be opened in speedscope or flamegraph.pl
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id:str, request:Request):
+    await require_admin(request)
+    path=profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path) as f:
+        return PlainTextResponse(
+            f.read(),
+            headers={"Content-Disposition":f'attachment; filename="{profile_id}.collapsed"'}
+        )
+
 # Home page
 @app.get("/", response_class=HTMLResponse)
 async def home(request:Request):
@@ -160,13 +449,10 @@ async def view_board(board_id:str, request:Request):
     user_email=await get_user_email(token_data)
     
     # Taking board data
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
 
     # Check if the user is a creator or a member
@@ -175,22 +461,20 @@ async def view_board(board_id:str, request:Request):
     is_creator=(user_email==board_data["creator"])
     
     tasks=[]
-    tasks_ref=db.collection("boards").document(board_id).collection("tasks").stream()
+    tasks_ref=tasks_collection(board_id).select(TASK_LIST_FIELDS).stream()
     
     active_count=0
     completed_count=0
 
     for task in tasks_ref:
-        task_data=task.to_dict()
-        task_data["id"]=task.id
+        task_record=TaskRecord.from_snapshot(task)
         # Check if task is completed
-        if task_data.get("completed", False):
+        if task_record.completed:
             completed_count +=1
         else:
             active_count +=1
 
-        task_data["unassigned"]=len(task_data.get("assignees", []))==0
-        tasks.append(task_data)
+        tasks.append(task_record)
 
     total_count=active_count + completed_count
 
@@ -214,13 +498,10 @@ async def board_members_page(board_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
     
     # Checking if the user is a creator or member
@@ -268,6 +549,7 @@ async def add_member(
     board_ref.update({
         "members":firestore.ArrayUnion([member_email])
     })
+    invalidate_board(board_id)
     
     return RedirectResponse(url=f"/board/{board_id}/members", status_code=303)
 
@@ -299,16 +581,16 @@ async def remove_member(
     board_ref.update({
         "members":firestore.ArrayRemove([member_email])
     })
+    invalidate_board(board_id)
 
     # Mark tasks assigned to the removed user as unassigned.
-    tasks_ref=db.collection("boards").document(board_id).collection("tasks").stream()
+    # Only the matching task references are fetched, no field payload.
+    tasks_ref=tasks_collection(board_id).where("assignees", "array_contains", member_email).select([]).stream()
     
     for task in tasks_ref:
-        task_data=task.to_dict()
-        if member_email in task_data.get("assignees", []):
-            db.collection("boards").document(board_id).collection("tasks").document(task.id).update({
-                "assignees": firestore.ArrayRemove([member_email])
-            })
+        task.reference.update({
+            "assignees": firestore.ArrayRemove([member_email])
+        })
 
     return RedirectResponse(url=f"/board/{board_id}/members", status_code=303)
 
@@ -318,22 +600,16 @@ async def board_settings_page(board_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
     
     if user_email !=board_data["creator"]:
         raise HTTPException(status_code=403, detail="Only the board creator can access settings")
 
-    task_count=0
-    tasks_ref=db.collection("boards").document(board_id).collection("tasks").stream()
-    for _ in tasks_ref:
-        task_count +=1
+    task_count=count_tasks(board_id)
     
     can_delete=len(board_data["members"])==0 and task_count==0
     
@@ -375,6 +651,7 @@ async def update_board_settings(
         "name":board_name,
         "description":description
     })
+    invalidate_board(board_id)
     
     return RedirectResponse(url=f"/board/{board_id}/settings", status_code=303)
 
@@ -400,15 +677,90 @@ async def delete_board(board_id:str, request:Request):
         raise HTTPException(status_code=400, detail="Cannot delete board with members")
     
     # Check if board has tasks
-    tasks_ref=db.collection("boards").document(board_id).collection("tasks").stream()
+    tasks_ref=tasks_collection(board_id).select([]).limit(1).stream()
     tasks=list(tasks_ref)
     if len(tasks) > 0:
         raise HTTPException(status_code=400, detail="Cannot delete board with tasks")
      
     board_ref.delete()
+    invalidate_board(board_id)
     
     return RedirectResponse(url="/", status_code=303)
 
+# Export the board tasks as NDJSON or CSV
+@app.get("/board/{board_id}/export")
+async def export_board(board_id:str, request:Request, format:str="ndjson"):
+    token_data=await get_current_user(request)
+    user_email=await get_user_email(token_data)
+
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+
+    board_data=get_board(board_id)
+    
+    if board_data is None:
+        raise HTTPException(status_code=404, detail="Board not found")
+
+    if user_email !=board_data["creator"] and user_email not in board_data["members"]:
+        raise HTTPException(status_code=403, detail="Not authorized to export this board")
+
+    media_type="application/x-ndjson" if format=="ndjson" else "text/csv"
+    return StreamingResponse(
+        profiling.follow_threads(board_transfer.export_board(db, board_id, format)),
+        media_type=media_type,
+        headers={"Content-Disposition":f'attachment; filename="board-{board_id}.{format}"'}
+    )
+
+# Bulk import tasks from an NDJSON or CSV upload
+@app.post("/board/{board_id}/import")
+async def import_board_tasks(
+    board_id:str,
+    request:Request,
+    file:UploadFile=File(...),
+    format:str=Form(""),
+    import_id:str=Form(""),
+    overwrite:bool=Form(False)
+):
+    token_data=await get_current_user(request)
+    user_email=await get_user_email(token_data)
+
+    board_ref=db.collection("boards").document(board_id)
+    board=board_ref.get()
+    
+    if not board.exists:
+        raise HTTPException(status_code=404, detail="Board not found")
+    
+    board_data=board.to_dict()
+
+    if user_email !=board_data["creator"]:
+        raise HTTPException(status_code=403, detail="Only the board creator can import tasks")
+
+    import_format=format or ("csv" if (file.filename or "").endswith(".csv") else "ndjson")
+    if import_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Unsupported import format")
+
+    if import_id and not board_transfer.is_valid_document_id(import_id):
+        raise HTTPException(status_code=400, detail="Invalid import id")
+
+    # Without an explicit id, retrying the same upload resumes the earlier import
+    if not import_id:
+        import_id=await run_in_threadpool(board_transfer.upload_import_id, board_id, file.file)
+
+    # Batches are committed from a worker thread so the event loop is not blocked
+    try:
+        result=await run_in_threadpool(
+            board_transfer.import_tasks,
+            db,
+            board_id,
+            board_transfer.iter_upload_rows(file.file, import_format),
+            user_email,
+            import_id,
+            overwrite=overwrite
+        )
+    except board_transfer.TransferError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(result)
+
 # Create task
 @app.post("/board/{board_id}/add_task")
 async def add_task(
@@ -422,13 +774,10 @@ async def add_task(
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
 
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
 
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
         raise HTTPException(status_code=403, detail="Not authorized to add tasks to this board")
@@ -455,13 +804,10 @@ async def add_task_page(board_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
     
     is_creator=(user_email==board_data["creator"])
@@ -487,13 +833,10 @@ async def view_task(board_id:str, task_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
 
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
@@ -547,14 +890,11 @@ async def edit_task(
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board_data=board.to_dict()
-    
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
         raise HTTPException(status_code=403, detail="Not authorized to modify this task")
     
@@ -588,13 +928,10 @@ async def edit_task_page(board_id:str, task_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
-    
-    board_data=board.to_dict()
     board_data["id"]=board_id
     
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
@@ -632,14 +969,11 @@ async def complete_task(board_id:str, task_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board_data=board.to_dict()
-    
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
         raise HTTPException(status_code=403, detail="Not authorized to modify this task")
     
@@ -663,14 +997,11 @@ async def delete_task(board_id:str, task_id:str, request:Request):
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board_data=board.to_dict()
-    
     if user_email !=board_data["creator"] and user_email not in board_data["members"]:
         raise HTTPException(status_code=403, detail="Not authorized to delete this task")
     
@@ -690,14 +1021,11 @@ async def assign_user(
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board_data=board.to_dict()
-    
     if user_email !=board_data["creator"]:
         raise HTTPException(status_code=403, detail="Only the board creator can assign users to tasks")
     
@@ -734,14 +1062,11 @@ async def unassign_user(
     token_data=await get_current_user(request)
     user_email=await get_user_email(token_data)
     
-    board_ref=db.collection("boards").document(board_id)
-    board=board_ref.get()
+    board_data=get_board(board_id)
     
-    if not board.exists:
+    if board_data is None:
         raise HTTPException(status_code=404, detail="Board not found")
     
-    board_data=board.to_dict()
-    
     if user_email !=board_data["creator"]:
         raise HTTPException(status_code=403, detail="Only the board creator can unassign users from tasks")
     
@@ -0,0 +1,184 @@
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Directory shared by the workers where profiles are stored
+PROFILE_DIR=os.environ.get("PROFILE_DIR", "/tmp/taskboard-profiles")
+
+# Fraction of requests profiled without the header, 0 disables sampling
+PROFILE_SAMPLE_RATE=float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+
+# Seconds between two stack samples
+PROFILE_INTERVAL=float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+
+# Oldest profiles are removed above this count
+PROFILE_MAX_FILES=200
+
+# Header an admin sends to profile a single request
+PROFILE_HEADER="x-profile-request"
+
+
+# Held while a request is profiled, other requests of the worker are not profiled meanwhile
+profile_slot=threading.Lock()
+
+# Requests currently handled by this worker, recorded with each profile
+requests_in_flight=0
+
+# Sampler of the request being profiled, copied into the thread pool with the request context
+current_sampler=contextvars.ContextVar("current_sampler", default=None)
+
+# The sampler thread only runs when it gets the GIL, the switch interval is
+# lowered to the sampling interval while a profile is active
+default_switch_interval=sys.getswitchinterval()
+
+
+def request_started():
+    global requests_in_flight
+    requests_in_flight +=1
+
+
+def request_finished():
+    global requests_in_flight
+    requests_in_flight -=1
+
+
+# Sampling the stacks of the request threads from a background thread
+class StackSampler:
+    def __init__(self, thread_id:int, interval:float=PROFILE_INTERVAL):
+        self.thread_ids={thread_id}
+        self.interval=interval
+        self.stacks=Counter()
+        self.samples=0
+        self.stopped=threading.Event()
+        self.thread=threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        sys.setswitchinterval(min(self.interval, default_switch_interval))
+        self.started_at=time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.duration=time.perf_counter() - self.started_at
+        sys.setswitchinterval(default_switch_interval)
+
+    # Thread pool threads are sampled only while they work for the request
+    def add_thread(self, thread_id:int):
+        self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id:int):
+        self.thread_ids.discard(thread_id)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frames=sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame=frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack=[]
+                while frame is not None:
+                    code=frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame=frame.f_back
+                self.stacks[";".join(reversed(stack))] +=1
+                self.samples +=1
+
+    # One "frame;frame;frame count" line per stack, readable by flamegraph.pl and speedscope
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# Iterating a streamed body with the thread that produces each item added to the sampler
+def follow_threads(iterable):
+    iterator=iter(iterable)
+    while True:
+        sampler=current_sampler.get()
+        thread_id=threading.get_ident()
+        if sampler is not None:
+            sampler.add_thread(thread_id)
+        try:
+            item=next(iterator)
+        except StopIteration:
+            return
+        finally:
+            if sampler is not None:
+                sampler.remove_thread(thread_id)
+        yield item
+
+
+def route_slug(route:str):
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+def new_profile_id(route:str):
+    return f"{int(time.time() * 1000)}-{os.getpid()}-{route_slug(route)}"
+
+
+# Writing the collapsed stacks and a metadata file next to them.
+# Other requests in flight during the profile show up in its stacks as well.
+def save_profile(profile_id:str, sampler:StackSampler, method:str, route:str, path:str, status_code:int, other_requests_at_start:int=0, other_requests_at_stop:int=0):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    created_at=time.time()
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.collapsed"), "w") as f:
+        f.write(sampler.collapsed())
+    meta={
+        "id":profile_id,
+        "method":method,
+        "route":route,
+        "path":path,
+        "status_code":status_code,
+        "duration_ms":round(sampler.duration * 1000, 2),
+        "samples":sampler.samples,
+        "other_requests_at_start":other_requests_at_start,
+        "other_requests_at_stop":other_requests_at_stop,
+        "created_at":created_at
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+        json.dump(meta, f)
+    prune_profiles()
+
+
+def prune_profiles():
+    names=sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for name in names[:-PROFILE_MAX_FILES]:
+        for suffix in (".json", ".collapsed"):
+            try:
+                os.unlink(os.path.join(PROFILE_DIR, name[:-len(".json")] + suffix))
+            except OSError:
+                pass
+
+
+# Newest profiles first, optionally only those of one route
+def list_profiles(route:str=None, limit:int=50):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles=[]
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                meta=json.load(f)
+        except (OSError, ValueError):
+            continue
+        if route and meta.get("route") !=route:
+            continue
+        profiles.append(meta)
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+
+# Path of a stored profile, None for unknown or malformed ids
+def profile_path(profile_id:str):
+    if not re.fullmatch(r"[0-9]+-[0-9]+-[A-Za-z0-9_]+", profile_id):
+        return None
+    path=os.path.join(PROFILE_DIR, f"{profile_id}.collapsed")
+    return path if os.path.exists(path) else None
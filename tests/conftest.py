@@ -0,0 +1,113 @@
+import pytest
+from google.cloud import firestore
+
+import admission
+import main
+
+try:
+    from fastapi.testclient import TestClient
+except RuntimeError:
+    # The test client needs httpx, tests using the client fixture are skipped without it
+    TestClient=None
+
+
+# Stand-in for db.collection("boards").document(id), every board id reads the same document
+class FakeBoards:
+    def __init__(self, board_data=None, on_get=None):
+        self.board_data=board_data
+        self.on_get=on_get
+        self.updates=[]
+
+    def collection(self, name):
+        return self
+
+    def document(self, document_id):
+        return self
+
+    def where(self, *args):
+        return self
+
+    def select(self, field_paths):
+        return self
+
+    def stream(self):
+        return []
+
+    def get(self):
+        if self.on_get:
+            self.on_get()
+        return FakeBoardSnapshot(self.board_data)
+
+    def update(self, changes):
+        self.updates.append(changes)
+        members=changes.get("members")
+        if isinstance(members, firestore.ArrayRemove):
+            self.board_data=dict(self.board_data, members=[m for m in self.board_data["members"] if m not in members.values])
+
+
+class FakeBoardSnapshot:
+    def __init__(self, board_data):
+        self.exists=board_data is not None
+        self.board_data=board_data
+
+    def to_dict(self):
+        return dict(self.board_data)
+
+
+class UserClient(TestClient if TestClient else object):
+    # Sends one request with the token cookie of the given user
+    def request_as(self, method, path, token, **kwargs):
+        self.cookies.clear()
+        if token:
+            self.cookies.set("token", token)
+        try:
+            return self.request(method, path, **kwargs)
+        finally:
+            self.cookies.clear()
+
+
+@pytest.fixture
+def verified(monkeypatch):
+    tokens=[]
+
+    # Any token is valid for "<token>@x" except the ones starting with "bad"
+    def verify_firebase_token(token, request):
+        tokens.append(token)
+        if token.startswith("bad"):
+            raise ValueError("Invalid token")
+        return {"email":f"{token}@x", "exp":9e9}
+
+    monkeypatch.setattr(main.google.oauth2.id_token, "verify_firebase_token", verify_firebase_token)
+    return tokens
+
+
+# Overridden by test modules that need a board or admins
+@pytest.fixture
+def board_data():
+    return None
+
+
+@pytest.fixture
+def admin_emails():
+    return set()
+
+
+@pytest.fixture
+def boards(monkeypatch, board_data):
+    boards=FakeBoards(board_data)
+    monkeypatch.setattr(main, "db", boards)
+    return boards
+
+
+@pytest.fixture
+def client(monkeypatch, verified, boards, admin_emails):
+    if TestClient is None:
+        pytest.skip("httpx is not installed")
+    monkeypatch.setattr(main, "admission_controller", admission.AdmissionController())
+    monkeypatch.setattr(main, "ADMIN_EMAILS", admin_emails)
+    main.token_cache.clear()
+    main.board_cache.clear()
+    # Handlers fail for anonymous callers, only the middleware outcome matters in these tests
+    client=UserClient(main.app, raise_server_exceptions=False)
+    client.verified=verified
+    return client
@@ -0,0 +1,91 @@
+"""Second worker process for the invalidation tests.
+
+Serves board requests from a board stored in a JSON file that both processes share,
+reports the status of the first request as the member, then waits for "removed" on
+stdin and polls until the member is refused.
+"""
+import json
+import os
+import sys
+import time
+
+from google.cloud import firestore
+
+MEMBER_TOKEN="member"
+OWNER_TOKEN="owner"
+
+
+# Board document kept in a JSON file, stands in for Firestore across processes
+class FileBoards:
+    def __init__(self, path):
+        self.path=path
+
+    def collection(self, name):
+        return self
+
+    def document(self, document_id):
+        return self
+
+    def where(self, *args):
+        return self
+
+    def select(self, field_paths):
+        return self
+
+    def stream(self):
+        return []
+
+    def get(self):
+        with open(self.path) as f:
+            board_data=json.load(f)
+        return FileBoardSnapshot(board_data)
+
+    def update(self, changes):
+        with open(self.path) as f:
+            board_data=json.load(f)
+        members=changes.get("members")
+        if isinstance(members, firestore.ArrayRemove):
+            board_data["members"]=[m for m in board_data["members"] if m not in members.values]
+        with open(self.path, "w") as f:
+            json.dump(board_data, f)
+
+
+class FileBoardSnapshot:
+    exists=True
+
+    def __init__(self, board_data):
+        self.board_data=board_data
+
+    def to_dict(self):
+        return dict(self.board_data)
+
+
+def verify_firebase_token(token, request):
+    return {"email":f"{token}@x", "exp":9e9}
+
+
+def run(board_file, deadline):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main
+    from fastapi.testclient import TestClient
+
+    main.db=FileBoards(board_file)
+    main.google.oauth2.id_token.verify_firebase_token=verify_firebase_token
+
+    # Entering the client runs the startup hook, which starts the bus
+    with TestClient(main.app) as client:
+        client.cookies.set("token", MEMBER_TOKEN)
+        print(f"status {client.get('/board/b').status_code}", flush=True)
+
+        sys.stdin.readline()
+        removed_at=time.monotonic()
+        while time.monotonic() - removed_at < deadline:
+            if client.get("/board/b").status_code==403:
+                print(f"denied {time.monotonic() - removed_at:.3f}", flush=True)
+                return
+            time.sleep(0.01)
+        print("allowed", flush=True)
+
+
+if __name__=="__main__":
+    run(sys.argv[1], float(sys.argv[2]))
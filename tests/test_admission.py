@@ -0,0 +1,57 @@
+import board_transfer
+import main
+
+
+def get_board(client, token):
+    return client.request_as("GET", "/board/b1", token).status_code
+
+
+def test_one_user_cannot_exhaust_the_board_budget(client):
+    codes=[get_board(client, "spammer") for _ in range(60)]
+    assert codes.count(404)==10
+    assert set(codes[10:])=={429}
+
+    assert [get_board(client, "member") for _ in range(3)]==[404, 404, 404]
+
+    rejected={r["reason"]:r["count"] for r in main.admission_controller.stats()["rejected"]}
+    assert rejected=={"user_rate":50}
+
+
+def test_anonymous_requests_do_not_use_the_board_budget(client):
+    for _ in range(60):
+        client.request_as("GET", "/board/b1", None)
+
+    assert ("board_view", "board", "b1") not in main.admission_controller.buckets
+    assert get_board(client, "member")==404
+
+
+def test_rejected_tokens_are_verified_once(client):
+    for _ in range(5):
+        get_board(client, "bad-token")
+
+    assert client.verified==["bad-token"]
+
+
+def test_rejected_requests_release_their_slot(client):
+    for _ in range(20):
+        get_board(client, "spammer")
+
+    assert main.admission_controller.in_flight==0
+
+
+def test_export_holds_its_slot_until_the_body_is_sent(client, boards, monkeypatch):
+    boards.board_data={"creator":"owner@x", "members":[], "name":"b", "description":""}
+    in_flight_while_streaming=[]
+
+    def export_board(db, board_id, export_format):
+        for n in range(3):
+            in_flight_while_streaming.append(main.admission_controller.in_flight)
+            yield f"{n}\n"
+
+    monkeypatch.setattr(board_transfer, "export_board", export_board)
+
+    response=client.request_as("GET", "/board/b1/export", "owner")
+
+    assert response.text=="0\n1\n2\n"
+    assert in_flight_while_streaming==[1, 1, 1]
+    assert main.admission_controller.in_flight==0
@@ -0,0 +1,196 @@
+import io
+import json
+
+import pytest
+
+import board_transfer
+
+
+# Minimal in-memory stand-in for the parts of the Firestore client used by board_transfer
+class FakeSnapshot:
+    def __init__(self, store, path):
+        self.id=path.rsplit("/", 1)[-1]
+        self.exists=path in store
+        self._data=store.get(path)
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, path):
+        self.store=store
+        self.path=path
+
+    def collection(self, name):
+        return FakeCollection(self.store, f"{self.path}/{name}")
+
+    def get(self):
+        return FakeSnapshot(self.store, self.path)
+
+
+class FakeCollection:
+    def __init__(self, store, path):
+        self.store=store
+        self.path=path
+
+    def document(self, document_id):
+        return FakeDocument(self.store, f"{self.path}/{document_id}")
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store=store
+        self.writes=[]
+
+    def set(self, ref, data):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        for path, data in self.writes:
+            self.store[path]=data
+
+
+class FakeDB:
+    def __init__(self):
+        self.store={}
+
+    def collection(self, name):
+        return FakeCollection(self.store, name)
+
+    def batch(self):
+        return FakeBatch(self.store)
+
+    def get_all(self, refs, field_paths=None):
+        return [FakeSnapshot(self.store, ref.path) for ref in refs]
+
+
+@pytest.fixture
+def db():
+    db=FakeDB()
+    db.store["boards/b"]={"creator":"owner@x", "members":["member@x"]}
+    return db
+
+
+def ndjson(*rows):
+    return board_transfer.iter_upload_rows(io.BytesIO("".join(json.dumps(r) + "\n" for r in rows).encode()), "ndjson")
+
+
+def task(**fields):
+    row={"title":"t", "due_date":"2026-01-01"}
+    row.update(fields)
+    return row
+
+
+def test_bad_field_types_are_reported_per_row(db):
+    result=board_transfer.import_tasks(db, "b", ndjson(
+        task(title=5),
+        task(assignees=[{"a":1}]),
+        task(created_at=123),
+        task(description=["x"]),
+        task()
+    ), "owner@x")
+
+    assert result["imported"]==1
+    assert [e["row"] for e in result["errors"]]==[1, 2, 3, 4]
+
+
+def test_invalid_task_ids_are_reported_per_row(db):
+    result=board_transfer.import_tasks(db, "b", ndjson(
+        task(id=".."),
+        task(id="__x__"),
+        task(id="a/b"),
+        task(id="ok")
+    ), "owner@x")
+
+    assert result["imported"]==1
+    assert [e["row"] for e in result["errors"]]==[1, 2, 3]
+    assert "boards/b/tasks/ok" in db.store
+
+
+def test_existing_tasks_are_kept_unless_overwrite(db):
+    db.store["boards/b/tasks/t1"]={"title":"original"}
+
+    result=board_transfer.import_tasks(db, "b", ndjson(task(id="t1", title="new")), "owner@x")
+    assert result["imported"]==0
+    assert result["errors"]==[{"row":1, "error":"Task t1 already exists"}]
+    assert db.store["boards/b/tasks/t1"]["title"]=="original"
+
+    result=board_transfer.import_tasks(db, "b", ndjson(task(id="t1", title="new")), "owner@x", overwrite=True)
+    assert result["imported"]==1
+    assert db.store["boards/b/tasks/t1"]["title"]=="new"
+
+
+def test_invalid_import_id_is_rejected(db):
+    with pytest.raises(board_transfer.TransferError):
+        board_transfer.import_tasks(db, "b", ndjson(task()), "owner@x", import_id="../x")
+
+
+def test_created_by_must_be_a_board_member(db):
+    board_transfer.import_tasks(db, "b", ndjson(
+        task(id="a", created_by="member@x"),
+        task(id="b", created_by="someone@else")
+    ), "owner@x")
+
+    assert db.store["boards/b/tasks/a"]["created_by"]=="member@x"
+    assert db.store["boards/b/tasks/b"]["created_by"]=="owner@x"
+
+
+def test_resume_skips_committed_rows(db):
+    rows=[task() for _ in range(5)]
+    first=board_transfer.import_tasks(db, "b", ndjson(*rows), "owner@x", batch_size=2)
+    again=board_transfer.import_tasks(db, "b", ndjson(*rows), "owner@x", import_id=first["import_id"], batch_size=2)
+
+    assert first["imported"]==5
+    assert again["imported"]==5
+    assert again["errors"]==[]
+    assert len([p for p in db.store if p.startswith("boards/b/tasks/")])==5
+
+
+def test_non_string_created_by_is_replaced(db):
+    result=board_transfer.import_tasks(db, "b", ndjson(task(id="a", created_by=["x"])), "owner@x")
+
+    assert result["errors"]==[]
+    assert db.store["boards/b/tasks/a"]["created_by"]=="owner@x"
+
+
+def test_undecodable_ndjson_line_is_reported_per_row(db):
+    upload=io.BytesIO(json.dumps(task(id="a")).encode() + b"\n\xff\xfe{}\n" + json.dumps(task(id="b")).encode() + b"\n")
+
+    result=board_transfer.import_tasks(db, "b", board_transfer.iter_upload_rows(upload, "ndjson"), "owner@x")
+
+    assert result["imported"]==2
+    assert result["errors"]==[{"row":2, "error":"row is not valid UTF-8"}]
+
+
+def test_undecodable_csv_keeps_rows_read_so_far(db):
+    upload=io.BytesIO(b"id,title,due_date\na,t,2026-01-01\nb,\xff,2026-01-01\n")
+
+    with pytest.raises(board_transfer.TransferError):
+        board_transfer.import_tasks(db, "b", board_transfer.iter_upload_rows(upload, "csv"), "owner@x", import_id="csv-import")
+
+    assert "boards/b/tasks/a" in db.store
+    assert db.store["boards/b/imports/csv-import"]["status"]=="failed"
+
+
+def test_upload_import_id_is_stable_for_the_same_upload():
+    upload=io.BytesIO(b"same content")
+
+    first=board_transfer.upload_import_id("b", upload)
+    assert upload.tell()==0
+    assert board_transfer.upload_import_id("b", upload)==first
+    assert board_transfer.upload_import_id("other", upload) !=first
+    assert board_transfer.upload_import_id("b", io.BytesIO(b"other content")) !=first
+    assert board_transfer.is_valid_document_id(first)
+
+
+def test_cli_prints_import_id_before_importing(db, tmp_path, monkeypatch, capsys):
+    upload=tmp_path / "tasks.ndjson"
+    upload.write_text(json.dumps(task()) + "\n")
+    monkeypatch.setattr(board_transfer.firestore, "Client", lambda: db)
+
+    # The board does not exist, the import fails before any batch
+    with pytest.raises(board_transfer.TransferError):
+        board_transfer.main(["import", "missing", str(upload)])
+
+    assert "Import id: " in capsys.readouterr().err
@@ -0,0 +1,120 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import invalidation
+import main
+from conftest import FakeBoards
+from invalidation_worker import MEMBER_TOKEN, OWNER_TOKEN, FileBoards
+
+# Longest a removed member may keep access on another worker
+DEADLINE=1.0
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.setattr(main, "BOARD_CACHE_TTL", 30)
+    main.board_cache.clear()
+    yield
+    main.board_cache.clear()
+
+
+# Output line of the worker starting with prefix, the Firestore client logs to stdout on import
+def read_line(worker, prefix):
+    for line in worker.stdout:
+        if line.startswith(prefix):
+            return line.strip()
+    raise AssertionError(f"Worker exited without {prefix!r} line")
+
+
+def test_removed_member_loses_access_on_every_worker(client, tmp_path, monkeypatch):
+    board_file=tmp_path / "board.json"
+    board_file.write_text(json.dumps({"creator":f"{OWNER_TOKEN}@x", "members":[f"{MEMBER_TOKEN}@x"], "name":"b", "description":""}))
+    socket_dir=tmp_path / "sockets"
+
+    worker=subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "invalidation_worker.py"), str(board_file), str(DEADLINE)],
+        env=dict(os.environ, INVALIDATION_BUS="unix", INVALIDATION_SOCKET_DIR=str(socket_dir)),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    bus=invalidation.UnixSocketInvalidationBus(str(socket_dir))
+    try:
+        # The other worker has cached the board with the member in it
+        assert read_line(worker, "status")=="status 200"
+
+        bus.start()
+        bus.subscribe(main.on_invalidate)
+        monkeypatch.setattr(main, "invalidation_bus", bus)
+        monkeypatch.setattr(main, "db", FileBoards(str(board_file)))
+        assert client.request_as("GET", "/board/b", MEMBER_TOKEN).status_code==200
+
+        response=client.request_as(
+            "POST",
+            "/board/b/remove_member",
+            OWNER_TOKEN,
+            data={"member_email":f"{MEMBER_TOKEN}@x"},
+            follow_redirects=False
+        )
+        assert response.status_code==303
+
+        worker.stdin.write("removed\n")
+        worker.stdin.flush()
+        assert read_line(worker, "denied").startswith("denied")
+        assert client.request_as("GET", "/board/b", MEMBER_TOKEN).status_code==403
+    finally:
+        bus.close()
+        worker.kill()
+        worker.wait()
+
+
+def test_invalidation_during_read_is_not_cached(monkeypatch):
+    boards=FakeBoards({"creator":"owner@x", "members":["member@x"]})
+    # The key arrives while the document read is in flight
+    boards.on_get=lambda: main.on_invalidate("board:b")
+    monkeypatch.setattr(main, "db", boards)
+
+    main.get_board("b")
+
+    assert "b" not in main.board_cache
+
+
+def test_local_bus_does_not_cache(monkeypatch):
+    monkeypatch.setattr(main, "BOARD_CACHE_TTL", 0)
+    boards=FakeBoards({"creator":"owner@x", "members":["member@x"]})
+    monkeypatch.setattr(main, "db", boards)
+
+    main.get_board("b")
+    boards.board_data={"creator":"owner@x", "members":[]}
+
+    assert main.board_cache=={}
+    assert main.get_board("b")["members"]==[]
+
+
+def snapshot_change(key, origin, change_type="ADDED"):
+    return SimpleNamespace(
+        type=SimpleNamespace(name=change_type),
+        document=SimpleNamespace(to_dict=lambda: {"key":key, "origin":origin})
+    )
+
+
+def test_firestore_listener_delivers_keys_from_other_workers():
+    bus=invalidation.FirestoreInvalidationBus(db=None)
+    bus.subscribe(main.on_invalidate)
+    main.board_cache["b"]=({"creator":"owner@x", "members":["member@x"]}, time.monotonic() + 30)
+    main.board_cache["own"]=({"creator":"owner@x", "members":[]}, time.monotonic() + 30)
+
+    bus._on_snapshot(None, [
+        snapshot_change("board:own", bus.origin),
+        snapshot_change("board:b", "other-worker"),
+        snapshot_change("board:own", "other-worker", "MODIFIED")
+    ], None)
+
+    assert "b" not in main.board_cache
+    assert "own" in main.board_cache
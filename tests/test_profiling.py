@@ -0,0 +1,92 @@
+import sys
+import time
+
+import pytest
+
+import board_transfer
+import main
+import profiling
+
+PROFILE_HEADERS={"X-Profile-Request":"1"}
+
+
+@pytest.fixture
+def admin_emails():
+    return {"admin@x"}
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def get(client, path, token):
+    return client.request_as("GET", path, token, headers=PROFILE_HEADERS)
+
+
+def test_admin_request_is_profiled(client):
+    response=get(client, "/board/b1", "admin")
+
+    profile_id=response.headers["X-Profile-Id"]
+    [meta]=profiling.list_profiles("/board/{board_id}")
+    assert meta["id"]==profile_id
+    assert meta["other_requests_at_start"]==0
+    assert meta["other_requests_at_stop"]==0
+    assert client.verified==["admin"]
+    assert sys.getswitchinterval()==profiling.default_switch_interval
+
+
+def test_non_admin_request_is_not_profiled(client):
+    response=get(client, "/board/b1", "member")
+
+    assert "X-Profile-Id" not in response.headers
+    assert profiling.list_profiles()==[]
+
+
+def test_header_does_not_verify_tokens_outside_admission(client):
+    for _ in range(5):
+        get(client, "/static/stylesss.css", "bad-token")
+
+    assert client.verified==[]
+
+
+def test_shed_requests_are_not_profiled(client):
+    main.admission_controller.max_in_flight=0
+
+    response=get(client, "/board/b1", "admin")
+
+    assert response.status_code==503
+    assert client.verified==[]
+    assert profiling.list_profiles()==[]
+
+
+def test_one_profile_per_worker_at_a_time(client):
+    with profiling.profile_slot:
+        response=get(client, "/board/b1", "admin")
+
+    assert response.status_code==404
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_streamed_export_is_profiled_until_the_last_row(client, boards, monkeypatch):
+    boards.board_data={"creator":"admin@x", "members":[], "name":"b", "description":""}
+
+    # Pages are read in the thread pool while the body is being sent
+    def export_board(db, board_id, export_format):
+        for n in range(3):
+            time.sleep(0.05)
+            yield f"{n}\n"
+
+    monkeypatch.setattr(board_transfer, "export_board", export_board)
+
+    response=get(client, "/board/b1/export", "admin")
+
+    assert response.text=="0\n1\n2\n"
+    [meta]=profiling.list_profiles("/board/{board_id}/export")
+    assert meta["id"]==response.headers["X-Profile-Id"]
+    with open(profiling.profile_path(meta["id"])) as f:
+        assert "export_board (test_profiling.py" in f.read()
+    assert not profiling.profile_slot.locked()
+    assert profiling.requests_in_flight==0
+    assert sys.getswitchinterval()==profiling.default_switch_interval
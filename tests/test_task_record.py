@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from google.cloud.firestore_v1.base_document import DocumentSnapshot
+
+import main
+
+
+def snapshot(task_id, data):
+    return DocumentSnapshot(
+        reference=SimpleNamespace(id=task_id),
+        data=data,
+        exists=True,
+        read_time=None,
+        create_time=None,
+        update_time=None
+    )
+
+
+def test_partial_snapshot_uses_defaults():
+    record=main.TaskRecord.from_snapshot(snapshot("t1", {"title":"Write docs"}))
+
+    assert record.id=="t1"
+    assert record.title=="Write docs"
+    assert record.due_date==""
+    assert record.completed is False
+    assert record.completed_at is None
+    assert record.assignees==[]
+    assert record.unassigned
+
+
+def test_full_snapshot():
+    record=main.TaskRecord.from_snapshot(snapshot("t2", {
+        "title":"Review",
+        "due_date":"2026-01-01",
+        "completed":True,
+        "completed_at":"2026-01-02",
+        "assignees":["a@x"]
+    }))
+
+    assert record.completed
+    assert record.assignees==["a@x"]
+    assert not record.unassigned